@@ -0,0 +1,251 @@
+import math
+import time
+from random import Random
+from pygame import Vector2
+from physics import Celestial_Body, Solver
+from quadtrees import Quadtree
+
+# Harness for checking that an optimized Solver configuration still produces the same physics as a reference one.
+# Both configurations run the same fixed-seed scene step by step, and the candidate is measured against the reference.
+
+DEFAULT_TOLERANCES = {
+    "position_error": 1.0, # Largest distance (in world units) any body may drift from its reference position
+    "overlap": 1.0, # Largest allowed increase in total overlap over the reference, measured every step
+    "constraint_violation": 1.0, # Largest allowed increase in how far any body sits outside of the constraint, measured every step
+    "energy_drift": 0.01, # Largest allowed increase in relative energy drift over the reference (gravity only)
+}
+
+
+def build_scene(seed:int = 0, count:int = 500, spread:float = 1500, mass:float = 2000000, orbital_velocity:float = 0) -> list[Celestial_Body]:
+    """Build a reproducible scene of random bodies, the same seed always gives the same scene.
+
+    Args:
+        seed (int, optional): _Random seed._ Defaults to 0.
+        count (int, optional): _Number of bodies._ Defaults to 500.
+        spread (float, optional): _Bodies are placed within a square of this half-width around the origin, without overlapping if there's room._ Defaults to 1500.
+        mass (float, optional): _Base mass, each body gets between one and five times this._ Defaults to 2000000.
+        orbital_velocity (float, optional): _If non-zero, bodies start moving around the origin at this speed (in world units per second)._ Defaults to 0.
+
+    Returns:
+        list[Celestial_Body]: _The scene._
+    """
+    random = Random(seed)
+    bodies = []
+    for body in range(count):
+        radius = random.randint(15, 45)
+        for attempt in range(100): # Bodies that start overlapping get shoved apart on the first step, and how hard depends on the substep, so try to avoid it
+            position = Vector2(random.uniform(-spread, spread), random.uniform(-spread, spread))
+            if all(position.distance_to(other.position) >= radius + other.radius for other in bodies):
+                break
+        celestial_body = Celestial_Body(position, radius, mass * random.randint(1, 5), (255, 255, 255))
+        if orbital_velocity and position.length() > 0:
+            celestial_body.velocity = Vector2(-position.y, position.x).normalize() * orbital_velocity
+        bodies.append(celestial_body)
+    return bodies
+
+
+def make_solver(bodies:list[Celestial_Body], config:dict, delta_time:float, constraint_radius:float = 4000) -> Solver:
+    """Create a Solver for the given bodies, config holds the keyword arguments passed to Solver.
+
+    Args:
+        bodies (list[Celestial_Body]): _Scene to solve, bodies with a velocity attribute get their Verlet history set up from it._
+        config (dict): _Solver keyword arguments._
+        delta_time (float): _Frame time step, needed to turn starting velocities into displacements._
+        constraint_radius (float, optional): _Radius of the circular constraint._ Defaults to 4000.
+
+    Returns:
+        Solver: _Ready to run solver._
+    """
+    solver = Solver(bodies, Quadtree(Vector2(0, 0), constraint_radius*2, 3), **config)
+    solver.create_constraint(constraint_radius, Vector2(0, 0))
+    for body in bodies:
+        body.previous_position = body.position - getattr(body, "velocity", Vector2()) * (delta_time / solver.subsets)
+    return solver
+
+
+def total_overlap(bodies:list[Celestial_Body]) -> float:
+    """Sum how far every pair of bodies overlaps, sweeps along the x axis so only nearby pairs get compared.
+
+    Args:
+        bodies (list[Celestial_Body]): _Bodies to check._
+
+    Returns:
+        float: _Total overlap._
+    """
+    overlap = 0
+    largest_radius = max((body.radius for body in bodies), default=0)
+    ordered = sorted(bodies, key=lambda body: body.position.x)
+    for index, body_1 in enumerate(ordered):
+        for body_2 in ordered[index+1:]:
+            if body_2.position.x - body_1.position.x > body_1.radius + largest_radius:
+                break
+            distance = body_1.position.distance_to(body_2.position)
+            if distance < body_1.radius + body_2.radius:
+                overlap += body_1.radius + body_2.radius - distance
+    return overlap
+
+
+def constraint_violation(solver:Solver) -> float:
+    """Find the furthest any body sits outside of the solver's constraint.
+
+    Args:
+        solver (Solver): _Solver with a constraint._
+
+    Returns:
+        float: _Largest violation, 0 if every body is inside._
+    """
+    violation = 0
+    for body in solver.objects:
+        distance = body.position.distance_to(solver.constraint_position) + body.radius - solver.constraint_radius
+        violation = max(violation, distance)
+    return violation
+
+
+def total_energy(solver:Solver, delta_time:float) -> float:
+    """Kinetic plus gravitational potential energy of the scene, velocities are estimated from each body's last Verlet displacement.
+
+    Args:
+        solver (Solver): _Solver to measure._
+        delta_time (float): _Frame time step._
+
+    Returns:
+        float: _Total energy._
+    """
+    substep = delta_time / solver.subsets
+    kinetic = 0
+    potential = 0
+    for index, body in enumerate(solver.objects):
+        step = substep / (2 ** body.timestep_level)
+        velocity = (body.position - body.previous_position) / step
+        kinetic += 0.5 * body.mass * velocity.length_squared()
+        for other in solver.objects[index+1:]:
+            distance = max(body.position.distance_to(other.position), body.radius + other.radius) # Same clamping as Solver.apply_gravity
+            potential -= solver.gravity * body.mass * other.mass / distance
+    return kinetic + potential
+
+
+def run(config:dict, steps:int, scene:dict, delta_time:float, measure_energy:bool) -> dict:
+    """Run a scene through one configuration and record what happened at every step.
+
+    Args:
+        config (dict): _Solver keyword arguments._
+        steps (int): _Number of frames to run._
+        scene (dict): _Keyword arguments for build\\_scene()._
+        delta_time (float): _Frame time step._
+        measure_energy (bool): _Whether to record the energy at the start and end._
+
+    Returns:
+        dict: _Positions, overlaps and constraint violations per step, energies, and the time spent inside Solver.update._
+    """
+    solver = make_solver(build_scene(**scene), config, delta_time)
+    record = {"positions": [], "overlap": [], "constraint_violation": [], "solve_time": 0}
+    if measure_energy:
+        record["start_energy"] = total_energy(solver, delta_time)
+
+    for step in range(steps):
+        start = time.perf_counter()
+        solver.update(delta_time)
+        record["solve_time"] += time.perf_counter() - start
+
+        record["positions"].append([Vector2(body.position) for body in solver.objects])
+        record["overlap"].append(total_overlap(solver.objects))
+        record["constraint_violation"].append(constraint_violation(solver))
+
+    if measure_energy:
+        record["end_energy"] = total_energy(solver, delta_time)
+    return record
+
+
+def energy_drift(record:dict) -> float:
+    """Relative change in energy over a run.
+
+    Args:
+        record (dict): _Result of run() with energies measured._
+
+    Returns:
+        float: _Relative drift._
+    """
+    if record["start_energy"] == 0:
+        return abs(record["end_energy"])
+    return abs((record["end_energy"] - record["start_energy"]) / record["start_energy"])
+
+
+def compare(reference:dict, candidate:dict, steps:int = 60, scene:dict = None, delta_time:float = 1/75, tolerances:dict = None) -> dict:
+    """Run the same fixed-seed scene through a reference and a candidate Solver configuration, then compare them step by step.
+
+    Args:
+        reference (dict): _Solver keyword arguments for the trusted configuration._
+        candidate (dict): _Solver keyword arguments for the configuration under test._
+        steps (int, optional): _Number of frames to run._ Defaults to 60.
+        scene (dict, optional): _Keyword arguments for build\\_scene()._ Defaults to the build\\_scene() defaults.
+        delta_time (float, optional): _Frame time step._ Defaults to 1/75.
+        tolerances (dict, optional): _Overrides for DEFAULT\\_TOLERANCES._ Defaults to None.
+
+    Returns:
+        dict: _Report with the speedup, every accuracy metric, and whether each one passed._
+    """
+    scene = scene or {}
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    measure_energy = bool(reference.get("timestep_levels", 0) or candidate.get("timestep_levels", 0)) # Gravity only exists in the block timestepping path
+
+    reference_record = run(reference, steps, scene, delta_time, measure_energy)
+    candidate_record = run(candidate, steps, scene, delta_time, measure_energy)
+
+    position_error = 0
+    for reference_positions, candidate_positions in zip(reference_record["positions"], candidate_record["positions"]):
+        for reference_position, candidate_position in zip(reference_positions, candidate_positions):
+            position_error = max(position_error, reference_position.distance_to(candidate_position))
+
+    overlap = max(candidate_overlap - reference_overlap for reference_overlap, candidate_overlap in zip(reference_record["overlap"], candidate_record["overlap"]))
+
+    metrics = {
+        "position_error": position_error,
+        "overlap": overlap,
+        "constraint_violation": max(candidate_violation - reference_violation for reference_violation, candidate_violation in zip(reference_record["constraint_violation"], candidate_record["constraint_violation"])),
+    }
+    if measure_energy:
+        metrics["energy_drift"] = energy_drift(candidate_record) - energy_drift(reference_record)
+
+    return {
+        "reference": reference,
+        "candidate": candidate,
+        "steps": steps,
+        "reference_time": reference_record["solve_time"],
+        "candidate_time": candidate_record["solve_time"],
+        "speedup": reference_record["solve_time"] / candidate_record["solve_time"] if candidate_record["solve_time"] else math.inf,
+        "metrics": metrics,
+        "passed": {name: value <= tolerances[name] for name, value in metrics.items()},
+        "tolerances": tolerances,
+    }
+
+
+def format_report(report:dict) -> str:
+    """Turn a compare() report into a short readable summary.
+
+    Args:
+        report (dict): _Result of compare()._
+
+    Returns:
+        str: _Summary text._
+    """
+    lines = [
+        f"Reference: {report['reference']}",
+        f"Candidate: {report['candidate']}",
+        f"Steps: {report['steps']}  ||  Reference: {report['reference_time']:.3f}s  ||  Candidate: {report['candidate_time']:.3f}s  ||  Speedup: {report['speedup']:.2f}x",
+    ]
+    for name, value in report["metrics"].items():
+        lines.append(f"    {name}: {value:.6g} (tolerance {report['tolerances'][name]:.6g}) {'PASS' if report['passed'][name] else 'FAIL'}")
+    lines.append("Result: " + ("PASS" if all(report["passed"].values()) else "FAIL"))
+    return "\n".join(lines)
+
+
+
+if __name__ == "__main__": # Default comparisons for the optimized modes
+    print(format_report(compare({"subsets": 8}, {"subsets": 8, "broadphase_interval": 8, "contact_margin": 20}, steps=30, scene={"count": 400, "spread": 1000, "orbital_velocity": 100})))
+    print()
+    # Dense pile that starts overlapping and blows apart, the cache can't be reused here so it just has to not cost anything
+    print(format_report(compare({"subsets": 8}, {"subsets": 8, "broadphase_interval": 8, "contact_margin": 20}, steps=30, scene={"count": 400, "spread": 600})))
+    print()
+    # Same subsets on both sides so collisions and the constraint run equally often, the reference just pins every body to the finest level
+    print(format_report(compare({"subsets": 1, "gravity": 1, "timestep_levels": 4, "timestep_accuracy": 0}, {"subsets": 1, "gravity": 1, "timestep_levels": 4}, steps=30,
+                                scene={"count": 60, "spread": 3000, "mass": 1000, "orbital_velocity": 200})))
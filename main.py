@@ -3,6 +3,7 @@ import sys
 from pygame import gfxdraw, Vector2
 from physics import Celestial_Body, Solver
 from quadtrees import Quadtree
+from rendering import Renderer
 from misc_tools import rainbow_cycle
 from random import randint
 
@@ -33,15 +34,15 @@ dragging = False
 mouse_position = pygame.mouse.get_pos()
 drag_start = [display_position, mouse_position]
 
-sys.setrecursionlimit(5000000) # Needed, stack overflow is not really gonna happen with how the recursion is built
 quadtree = Quadtree(Vector2(0, 0), 8000, 3)
 celestial_bodies = [Celestial_Body(Vector2(0, 0), 15, DEFAULT_MASS, (0, 50, 255)), Celestial_Body(Vector2(0 + 80, 0), 30, DEFAULT_MASS*2, (255, 165, 0))]
 
 # for body in range(5000): # Uncomment for spawning of 5000 random objects
 #     celestial_bodies.append(Celestial_Body(Vector2(randint(-3800, 3800), randint(-3800, 3800)), randint(15, 45), DEFAULT_MASS*randint(1, 5), rainbow_cycle(body/10)))
 
-solver = Solver(celestial_bodies, quadtree, subsets=8)
+solver = Solver(celestial_bodies, quadtree, subsets=8, broadphase_interval=8, contact_margin=20)
 solver.create_constraint(8000/2, Vector2(0, 0))
+renderer = Renderer()
 
 
 pygame.font.init()
@@ -157,11 +158,10 @@ while running:
         total_time += delta_time
         
     # Render objects
-    solver.draw_constraint(display, display_scale, display_position)
-    for object in solver.objects:
-        object.draw(display, display_scale, display_position)
+    renderer.draw_constraint(display, solver, display_scale, display_position)
+    renderer.draw_bodies(display, solver.objects, display_scale, display_position, solver.quadtree)
     if debug >= 1:
-        solver.quadtree.draw_quad(display, (200, 200, 200), display_scale, display_position)
+        renderer.draw_quadtree(display, solver.quadtree, (200, 200, 200), display_scale, display_position)
         gfxdraw.box(display, pygame.Rect(0, 0, 10, 10), rainbow_cycle(total_time))
     
 
@@ -177,6 +177,9 @@ while running:
 
         debug_text(display, Vector2(0, 0), f"Quadtree checks: {solver.quadtree.positional_checks}  ||  Quadtree depth: {solver.quadtree.furthest_depth} || {temp}", debug_font, (200, 200, 200))
         debug_text(display, Vector2(0, 18), f"Collision checks: {solver.collision_checks}", debug_font, (200, 200, 200))
+        if solver.timestep_levels > 0:
+            debug_text(display, Vector2(0, 90), f"Timestep levels: {solver.timestep_population}  ||  Force evaluations: {solver.force_evaluations}", debug_font, (200, 200, 200))
+        debug_text(display, Vector2(0, 108), f"Bodies drawn: {renderer.bodies_drawn}  ||  Cached sprites: {len(renderer.sprites)}  ||  Sprite misses: {renderer.sprite_misses}", debug_font, (200, 200, 200))
     
     # try:
     if debug >= 1:
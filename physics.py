@@ -1,3 +1,4 @@
+import math
 import pygame
 from pygame import gfxdraw, Vector2
 from quadtrees import Quadtree
@@ -21,6 +22,8 @@ class Celestial_Body():
         self.anchored = False # Anchored isn't necessary, but I like extra functionality
         
         self.previous_position = position # This is just for our Verlet calculations
+        self.timestep_level = 0 # Block timestepping level, the body steps with the solver's substep divided by 2^level
+        self.sprite_color = None # Renderer cache of (color, quantized color), so the quantizing only happens again if the color changes
         
       
         
@@ -67,24 +70,43 @@ class Celestial_Body():
 
 
 class Solver():
-    def __init__(self, objects:list[Celestial_Body], quadtree: "Quadtree", gravity:float = 6.67*10**-11, subsets:int = 8) -> None:
+    def __init__(self, objects:list[Celestial_Body], quadtree: "Quadtree", gravity:float = 6.67*10**-11, subsets:int = 8, broadphase_interval:int = 1, contact_margin:float = 0, timestep_levels:int = 0, timestep_accuracy:float = 0.05) -> None:
         """Initialize a physics solving object, Solver only works on particles initialized by the Celestial\_Body class for the time being.
 
         Args:
             objects (list[Celestial_Body]): _Your initial list of Celestial Bodies._
             gravity (float, optional): _Gravitational constant._ Defaults to 6.67*10**-11, also known as the Universe's.
             subsets (int, optional): _Subsets (or physics steps) to run in a timestep, higher will result in lower performance, lower will result in worse simulation quality, keep it balanced._ Defaults to 8.
+            broadphase_interval (int, optional): _Run the full Quadtree broadphase once every this many substeps, substeps in between only resolve the cached contact pairs._ Defaults to 1 (no caching).
+            contact_margin (float, optional): _Extra distance added to the combined radius when caching contact pairs, bodies moving further than half of this force an early broadphase._ Defaults to 0.
+            timestep_levels (int, optional): _Number of power-of-two timestep levels for gravitating bodies, level 0 takes the full substep and each level after takes half of the one before._ Defaults to 0, which disables gravity and block timestepping entirely.
+            timestep_accuracy (float, optional): _Accuracy parameter for picking a body's timestep level, lower will push bodies onto finer levels, 0 keeps every body on the finest level._ Defaults to 0.05.
         """        
         self.objects = objects
         self.subsets = subsets
         self.gravity = gravity
         self.quadtree = quadtree
         
+        self.broadphase_interval = broadphase_interval
+        self.contact_margin = contact_margin
+        self.contact_pairs: list[tuple[Celestial_Body, Celestial_Body]] = [] # Pairs found touching (or nearly touching) during the last broadphase
+        self.contact_anchors: list[tuple[Celestial_Body, Vector2]] = [] # Positions of every body at the last broadphase
+        self.contact_objects = None # The object list the cache was built from, main.py likes to swap it out
+        self.substeps_since_broadphase = 0
+        self.contact_backoff = 0 # Broadphases to skip recording for after a cache went unused, doubles each time (up to the interval) so exploding or churning scenes stop paying for it
+        self.contact_skips = 0 # Recordings left to skip
+        
+        self.timestep_levels = timestep_levels
+        self.timestep_accuracy = timestep_accuracy
+        self.timestep_population: list[int] = [0] * timestep_levels # Debug, how many bodies sit on each level
+        self.force_evaluations = 0 # Debug, gravity evaluations (one per body step) during the last update
+        
         self.constraint_position = False
         self.constraint_radius = False
         self.constraint_color = (65, 65, 65)
         
         self.collision_checks = 0
+        self.broadphase_count = 0 # Debug, how many full broadphases have run
         
     
     def create_constraint(self, radius:int, position:Vector2 = Vector2(0,0), color:tuple[int,int,int] = (165, 165, 165)) -> None:
@@ -134,59 +156,212 @@ class Solver():
             delta_time (_float_): _Physics time step, divided so that each subset has a fraction of the timestep._
         """        
         delta_time = delta_time/self.subsets
+        self.force_evaluations = 0
         for subset in range(self.subsets):
             self.apply_constraint()
             self.solve_collisions()
-            for object in self.objects:
-                object.update_position(delta_time)
+            if self.timestep_levels > 0:
+                self.block_step(delta_time)
+            else:
+                for object in self.objects:
+                    object.update_position(delta_time)
     
     
-    def solve_collisions(self) -> None:
-        """Solve collisions for all Celestial Bodies, currently runs in O(n^2) time complexity (each particle compares with every other one), upcoming Quadtree implementation will speed this up substantially.
+    def block_step(self, delta_time:float) -> None:
+        """Advance every body by one substep using hierarchical (block) timesteps. The substep is split into 2^(levels-1) ticks, a body on level L steps once every 2^(levels-1-L) ticks and only has its gravity evaluated when it steps.
+        Bodies that aren't stepping are interpolated to the current tick so the active ones still feel them in roughly the right place.
+
+        Args:
+            delta_time (float): _Substep time, this is the step taken by bodies on level 0._
         """        
-        self.quadtree = Quadtree(self.quadtree.position, self.quadtree.width, self.quadtree.expansion_threshold)
+        ticks = 2 ** (self.timestep_levels - 1)
+        for tick in range(ticks):
+            active = []
+            sources = []
+            for body in self.objects:
+                period = ticks >> body.timestep_level
+                phase = tick % period
+                if phase == 0:
+                    active.append(body)
+                    sources.append((body, body.position))
+                else: # Position holds the end of the body's current step, previous position holds the start
+                    sources.append((body, body.previous_position + (body.position - body.previous_position) * (phase / period)))
+            
+            self.apply_gravity(active, sources)
+            for body in active:
+                old_step = delta_time / (2 ** body.timestep_level)
+                body.timestep_level = self.choose_timestep_level(body, delta_time, old_step, tick)
+                new_step = delta_time / (2 ** body.timestep_level)
+                if new_step != old_step: # Verlet stores velocity as the last displacement, so it has to be rescaled to the new step
+                    body.previous_position = body.position - (body.position - body.previous_position) * (new_step / old_step)
+                body.update_position(new_step)
         
+        self.timestep_population = [0] * self.timestep_levels
         for body in self.objects:
-            self.quadtree.insert(body)
+            self.timestep_population[body.timestep_level] += 1
+    
+    
+    def choose_timestep_level(self, body:Celestial_Body, delta_time:float, current_step:float, tick:int) -> int:
+        """Pick the timestep level for a body about to step. The wanted step is _accuracy * min(sqrt(radius/acceleration), radius/velocity)_, then rounded down to a power-of-two fraction of the substep.
+        Bodies may always move to a finer level, but only move to a coarser one when the current tick lines up with that level's schedule.
+
+        Args:
+            body (Celestial_Body): _Body that is about to step, with its acceleration already evaluated._
+            delta_time (float): _Substep time (level 0 step)._
+            current_step (float): _The body's current step, used to estimate its velocity._
+            tick (int): _Current tick within the substep._
+
+        Returns:
+            int: _New timestep level._
+        """        
+        if self.timestep_accuracy <= 0: # Everyone on the finest level, a uniform step to compare block timestepping against
+            return self.timestep_levels - 1
+        
+        acceleration = body.acceleration.length()
+        velocity = (body.position - body.previous_position).length() / current_step
+        wanted_step = float("inf")
+        if acceleration > 0:
+            wanted_step = min(wanted_step, self.timestep_accuracy * math.sqrt(body.radius / acceleration))
+        if velocity > 0:
+            wanted_step = min(wanted_step, self.timestep_accuracy * body.radius / velocity)
+        
+        level = 0
+        if wanted_step <= 0: # Radius 0 bodies that move at all, the log below would divide by zero
+            level = self.timestep_levels - 1
+        elif wanted_step < delta_time:
+            level = min(math.ceil(math.log2(delta_time / wanted_step)), self.timestep_levels - 1)
         
+        ticks = 2 ** (self.timestep_levels - 1)
+        while level < body.timestep_level and tick % (ticks >> level) != 0: # Coarser levels need to be synchronized
+            level += 1
+        return level
+    
+    
+    def apply_gravity(self, bodies:list[Celestial_Body], sources:list[tuple[Celestial_Body, Vector2]]) -> None:
+        """Accumulate gravitational acceleration on the given bodies by direct summation, runs in O(n*m) time complexity. Distances are clamped to the combined radius so overlapping bodies don't explode.
+
+        Args:
+            bodies (list[Celestial_Body]): _Bodies to evaluate gravity for._
+            sources (list[tuple[Celestial_Body, Vector2]]): _Every attracting body paired with the position to attract from._
+        """        
+        for body in bodies:
+            self.force_evaluations += 1
+            for other, other_position in sources:
+                if other is body:
+                    continue
+                axis = other_position - body.position
+                distance = axis.length()
+                if distance == 0:
+                    continue
+                softened = max(distance, body.radius + other.radius)
+                body.acceleration += axis * (self.gravity * other.mass / (softened * softened * distance))
+    
+    
+    def solve_collisions(self) -> None:
+        """Solve collisions for all Celestial Bodies. Rebuilds the Quadtree and runs the full broadphase when the contact cache is stale, otherwise only the cached contact pairs are resolved.
+        """        
         self.collision_checks = 0
-        self.quadtree_collision_check(self.quadtree)
+        if self.contact_cache_stale():
+            self.quadtree = Quadtree(self.quadtree.position, self.quadtree.width, self.quadtree.expansion_threshold)
+            
+            for body in self.objects:
+                self.quadtree.insert(body)
+            
+            if self.contact_anchors: # A cache was recorded, check whether it saved any broadphases
+                if self.substeps_since_broadphase > 1:
+                    self.contact_backoff = 0
+                else:
+                    self.contact_backoff = min(max(self.contact_backoff*2, 1), self.broadphase_interval)
+                    self.contact_skips = self.contact_backoff
+            
+            found_pairs = None # Recording pairs only pays off if the cache gets reused
+            if self.broadphase_interval > 1:
+                if self.contact_skips > 0:
+                    self.contact_skips -= 1
+                else:
+                    found_pairs = {}
+            self.quadtree_collision_check(self.quadtree, found_pairs)
+            
+            self.contact_pairs = list(found_pairs.values()) if found_pairs is not None else []
+            self.contact_anchors = [(body, Vector2(body.position)) for body in self.objects] if found_pairs is not None else [] # Copies, positions get operated on in place
+            self.contact_objects = self.objects
+            self.substeps_since_broadphase = 1
+            self.broadphase_count += 1
+            return
+        
+        for body_1, body_2 in self.contact_pairs:
+            self.collision_checks += 1
+            self.resolve_collision(body_1, body_2)
+        self.substeps_since_broadphase += 1
+    
     
+    def contact_cache_stale(self) -> bool:
+        """Check whether the cached contact pairs can still be trusted. Two bodies that were further than the margin apart at the last broadphase can only have met if one of them has moved more than half of the margin since.
 
-    def quadtree_collision_check(self, quadtree:Quadtree) -> None:
+        Returns:
+            bool: _True if a full broadphase is needed._
+        """        
+        if self.broadphase_interval <= 1 or self.substeps_since_broadphase >= self.broadphase_interval:
+            return True
+        if self.contact_objects is not self.objects or len(self.contact_anchors) != len(self.objects): # Bodies were added or removed
+            return True
+        
+        max_displacement = (self.contact_margin/2) ** 2
+        for body, anchor in self.contact_anchors:
+            if (body.position - anchor).length_squared() > max_displacement:
+                return True
+        return False
+    
+
+    def quadtree_collision_check(self, quadtree:Quadtree, found_pairs:dict = None) -> None:
         """Check for collisions between all Quadtree contents.
 
         Args:
             quadtree (Quadtree): _Quadtree full of objects._
+            found_pairs (dict, optional): _Filled with every pair of bodies within the contact margin of each other, used for the contact cache._ Defaults to None (no recording).
         """        
-        if quadtree.is_divided: # We need to do this recursively
-            for cell_row in quadtree.cells:
-                for cell in cell_row:
-                    self.quadtree_collision_check(cell)
-                    
-        else: # Does not yet compare to adjacent Quadtree cells... TODO
+        for leaf in quadtree.leaves(): # Does not yet compare to corner Quadtree cells... TODO
             object_pool = []
-            object_pool += quadtree.contents
-            for cell in quadtree.find_adjacent():
+            object_pool += leaf.contents
+            for cell in leaf.find_adjacent():
                 object_pool += cell.contents
             for body_1 in object_pool:
                 for body_2 in object_pool:
                     self.collision_checks+=1 # Increment debug variable
                     
                     if body_1 != body_2:
-                        collision_axis = body_1.position - body_2.position # Axis of collision is also the midpoint
-                        distance = collision_axis.length()
+                        distance = self.resolve_collision(body_1, body_2)
+                        if found_pairs is not None and distance < body_1.radius + body_2.radius + self.contact_margin:
+                            key = (id(body_1), id(body_2)) if id(body_1) < id(body_2) else (id(body_2), id(body_1)) # Order doesn't matter, so store each pair once
+                            found_pairs[key] = (body_1, body_2)
+    
+    
+    @staticmethod
+    def resolve_collision(body_1:Celestial_Body, body_2:Celestial_Body) -> float:
+        """Push two bodies apart if they overlap, each body takes half of the overlap.
+
+        Args:
+            body_1 (Celestial_Body): _First body._
+            body_2 (Celestial_Body): _Second body._
 
-                        if distance < body_1.radius + body_2.radius: # If the collision axis is shorter than the combined radius then there is a collision
-                            try:
-                                collision_angle = collision_axis / distance # Now we pretty much normalize the axis to get the angle
+        Returns:
+            float: _Distance between the bodies before they were pushed apart._
+        """        
+        collision_axis = body_1.position - body_2.position # Axis of collision is also the midpoint
+        distance = collision_axis.length()
 
-                            except ZeroDivisionError:
-                                collision_angle = Vector2()
+        if distance < body_1.radius + body_2.radius: # If the collision axis is shorter than the combined radius then there is a collision
+            try:
+                collision_angle = collision_axis / distance # Now we pretty much normalize the axis to get the angle
 
-                            
-                            overlap = body_1.radius + body_2.radius - distance # Figure out how far the bodies are touching
+            except ZeroDivisionError:
+                collision_angle = Vector2()
 
-                            body_1.position += (0.5 * overlap * collision_angle) * (not body_1.anchored) # Include anchored in the off chance that we want that functionality, may be removed further down the line
-                            body_2.position -= (0.5 * overlap * collision_angle) * (not body_2.anchored) # Multiply by 0.5 each time because we want to equally distribute the collision between the objects
+            
+            overlap = body_1.radius + body_2.radius - distance # Figure out how far the bodies are touching
+
+            body_1.position += (0.5 * overlap * collision_angle) * (not body_1.anchored) # Include anchored in the off chance that we want that functionality, may be removed further down the line
+            body_2.position -= (0.5 * overlap * collision_angle) * (not body_2.anchored) # Multiply by 0.5 each time because we want to equally distribute the collision between the objects
+        
+        return distance
 
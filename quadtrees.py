@@ -41,6 +41,7 @@ class Quadtree():
         # These are only used by the ancestor for debug
         self.positional_checks: int = 0
         self.furthest_depth: int = 1
+        self.object_count: int = 0
         self.temp = False
                 
         self.monopole = 0
@@ -50,36 +51,62 @@ class Quadtree():
     
     
     def insert(self, object) -> None:
-        """Insert an object into this quadtree cell, inserted object needs a position.
+        """Insert an object into this quadtree cell, inserted object needs a position. Uses an explicit stack rather than recursion so deep trees don't touch the recursion limit.
 
         Args:
             object (_Any_): _Object for insertion, preferably a Celestial\_Body._
         """        
+        self.ancestor.object_count += 1 # For debug, and so the renderer can tell if the tree is missing bodies
+        pending = [(self, object)]
+        while pending:
+            cell, obj = pending.pop()
+            while cell.is_divided:
+                cell = cell.child_containing(obj.position)
+            
+            cell.contents.append(obj)
+            
+            if len(cell.contents) > cell.expansion_threshold and cell.depth < cell.ancestor.max_depth:
+                old_contents = cell.contents
+                cell.contents = []
+                cell.subdivide()
+                for old_obj in reversed(old_contents): # Now that we have split, we need to find the cells that our contents inhabit. Reversed so they pop off in their original order
+                    pending.append((cell, old_obj))
+    
+    
+    def child_containing(self, position:Vector2) -> "Quadtree":
+        """Return the direct child cell that a given position falls in, the cell must already be divided.
 
-        if self.is_divided:
-            x = 1
-            y = 1
-            if object.position.x < self.position.x:
-                x = 0
-            if object.position.y < self.position.y:
-                y = 0
-            self.cells[x][y].insert(object)
-            return
-        
-        self.contents.append(object)
-        
-        if len(self.contents) > self.expansion_threshold and self.depth < self.ancestor.max_depth:
-            old_contents = self.contents[:]
-            self.contents = []
-            self.subdivide()
-            for obj in old_contents: # Now that we have split, we need to find the cells that our contents inhabit
-                x = 1
-                y = 1
-                if obj.position.x < self.position.x:
-                    x = 0
-                if obj.position.y < self.position.y:
-                    y = 0
-                self.cells[x][y].insert(obj)
+        Args:
+            position (Vector2): _Position to search with._
+
+        Returns:
+            Quadtree: _Child cell._
+        """        
+        x = 1
+        y = 1
+        if position.x < self.position.x:
+            x = 0
+        if position.y < self.position.y:
+            y = 0
+        return self.cells[x][y]
+    
+    
+    def leaves(self):
+        """Iterate over every undivided cell below (or including) this one, in the same order a depth-first recursion would visit them.
+
+        Yields:
+            Quadtree: _Leaf cell._
+        """        
+        stack = [self]
+        while stack:
+            cell = stack.pop()
+            if cell.is_divided:
+                stack.append(cell.cells[1][1]) # Pushed backwards so [0][0] comes off first
+                stack.append(cell.cells[1][0])
+                stack.append(cell.cells[0][1])
+                stack.append(cell.cells[0][0])
+            else:
+                yield cell
     
     
     @staticmethod
@@ -220,11 +247,14 @@ class Quadtree():
             _list[Quadtree...]_: _A potentially long list of children Quadtree cells._
         """        
         found_cells = []
-        if cell.is_divided:
-            for index in indices: # Thanks to this data structure's patterns, children cells will repeat the same two indices for as long as you traverse down 
-                found_cells += cell.find_child_pair(cell.cells[index[0]][index[1]], indices) # Recursion putting in the work
-        else:
-            found_cells.append(cell)
+        stack = [cell]
+        while stack:
+            cell = stack.pop()
+            if cell.is_divided:
+                for index in reversed(indices): # Thanks to this data structure's patterns, children cells will repeat the same two indices for as long as you traverse down
+                    stack.append(cell.cells[index[0]][index[1]])
+            else:
+                found_cells.append(cell)
         return found_cells
         
     def subdivide(self) -> None:
@@ -244,7 +274,7 @@ class Quadtree():
         
     
     def draw_quad(self, surface: pygame.Surface, color: tuple[int, int, int] = (200, 200, 200), scale: float = 1, offset: Vector2 = Vector2(0, 0)) -> None:
-        """Use PyGame.gfxdraw to recursively render all child cells of this Quadtree, exists purely for debug.
+        """Use PyGame.gfxdraw to render this Quadtree cell and all of its children, exists purely for debug.
 
         Args:
             surface (pygame.Surface): _PyGame Surface to render on._
@@ -257,14 +287,15 @@ class Quadtree():
         # gfxdraw.rectangle(surface, rect, color)
         
         # The above solution (drawing the rect) although likely more efficient seems to have some precision issues.
-        points = [Vector2(self.position.x - self.width / 2, self.position.y - self.width / 2) * scale + offset, 
-                       Vector2(self.position.x + self.width / 2, self.position.y - self.width / 2) * scale + offset, 
-                       Vector2(self.position.x + self.width / 2, self.position.y + self.width / 2) * scale + offset, 
-                       Vector2(self.position.x - self.width / 2, self.position.y + self.width / 2) * scale + offset]
-        gfxdraw.polygon(surface, points, color)
-        
-        
-        if self.is_divided: # This is a recursive function of course.
-            for cell_row in self.cells:
-                for cell in cell_row:
-                    cell.draw_quad(surface, color, scale, offset)
\ No newline at end of file
+        stack = [self]
+        while stack:
+            cell = stack.pop()
+            points = [Vector2(cell.position.x - cell.width / 2, cell.position.y - cell.width / 2) * scale + offset, 
+                           Vector2(cell.position.x + cell.width / 2, cell.position.y - cell.width / 2) * scale + offset, 
+                           Vector2(cell.position.x + cell.width / 2, cell.position.y + cell.width / 2) * scale + offset, 
+                           Vector2(cell.position.x - cell.width / 2, cell.position.y + cell.width / 2) * scale + offset]
+            gfxdraw.polygon(surface, points, color)
+            
+            if cell.is_divided:
+                for cell_row in cell.cells:
+                    stack += cell_row
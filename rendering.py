@@ -0,0 +1,409 @@
+import pygame
+from collections import OrderedDict
+from operator import attrgetter
+from pygame import gfxdraw, Vector2
+
+
+class Renderer():
+    def __init__(self, max_sprites:int = 4096, color_step:int = 16, max_sprite_radius:int = 256, cull_margin:float = 64) -> None:
+        """Initialize a Renderer, which draws bodies from a cache of pre-rendered circle sprites in one batched blit and keeps the constraint and Quadtree debug drawings around until the camera (or tree structure) changes.
+
+        Args:
+            max_sprites (int, optional): _Most sprites kept in the cache, the least recently used ones get evicted first._ Defaults to 4096.
+            color_step (int, optional): _Colors are rounded down to a multiple of this before looking up a sprite, higher means fewer sprites but less accurate colors._ Defaults to 16.
+            max_sprite_radius (int, optional): _Bodies bigger than this on screen are drawn directly instead, their sprites would be huge._ Defaults to 256.
+            cull_margin (float, optional): _Extra world-space padding around the screen when culling Quadtree cells, on top of the largest body radius, covers bodies that moved since the tree was built._ Defaults to 64.
+        """
+        self.max_sprites = max_sprites
+        self.color_step = color_step
+        self.max_sprite_radius = max_sprite_radius
+        self.cull_margin = cull_margin
+
+        self.sprites: OrderedDict[tuple[int, tuple[int, int, int]], pygame.Surface] = OrderedDict() # (radius, color): sprite, kept in least to most recently used order
+        self.sprite_scale = None # Scale the sprites were last used at
+        self.mapped_colors: dict[tuple[int,int,int], int] = {} # Quantized color: surface pixel value, for bodies drawn as single pixels
+        self.mapped_surface = None # Surface the mapped colors belong to
+        self.plan = None # See draw_plan()
+        self.plan_key = None
+        self.plan_bodies = None
+        self.plan_surface = None
+        self.largest_radius = 0 # World-space radius of the biggest body, only refreshed when the body list or its length changes
+        self.radius_bodies = None
+        self.radius_count = 0
+
+        self.constraint_layer = None
+        self.constraint_key = None
+        self.quadtree_layer = None
+        self.quadtree_key = None
+        self.quadtree_tree = None
+        self.quadtree_structure = None
+
+        # Debug
+        self.sprite_misses = 0
+        self.bodies_drawn = 0
+
+
+    def get_sprite(self, radius:int, color:tuple[int,int,int]) -> pygame.Surface:
+        """Find (or render) the anti-aliased circle sprite for a given on-screen radius and color.
+
+        Args:
+            radius (int): _On-screen radius in pixels._
+            color (tuple[int,int,int]): _RGB tuple, should already be quantized._
+
+        Returns:
+            pygame.Surface: _Sprite, the circle's center sits at (radius, radius)._
+        """
+        key = (radius, color)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key) # Mark as most recently used
+            return sprite
+
+        self.sprite_misses += 1
+        sprite = pygame.Surface((radius*2 + 1, radius*2 + 1), pygame.SRCALPHA)
+        gfxdraw.aacircle(sprite, radius, radius, radius, color)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False) # Least recently used
+        return sprite
+
+
+    def quantize_color(self, color:tuple[int,int,int]) -> tuple[int,int,int]:
+        """Round a color down onto the sprite color grid, so that bodies with nearly identical colors share sprites.
+
+        Args:
+            color (tuple[int,int,int]): _RGB tuple, floats are fine._
+
+        Returns:
+            tuple[int,int,int]: _Quantized RGB tuple._
+        """
+        step = self.color_step
+        return (int(color[0]) // step * step, int(color[1]) // step * step, int(color[2]) // step * step)
+
+
+    def body_color(self, body) -> tuple[int,int,int]:
+        """Get a body's quantized color, caching it on the body since hashing the float colors every frame is surprisingly slow.
+
+        Args:
+            body (Celestial_Body): _Body with a sprite\_color attribute._
+
+        Returns:
+            tuple[int,int,int]: _Quantized RGB tuple._
+        """
+        sprite_color = body.sprite_color
+        if sprite_color is None or sprite_color[0] is not body.color:
+            sprite_color = body.sprite_color = (body.color, self.quantize_color(body.color))
+        return sprite_color[1]
+
+
+    def mapped_color(self, surface:pygame.Surface, color:tuple[int,int,int]) -> int:
+        """Get the surface pixel value for a quantized color, used for bodies written straight into the pixels.
+
+        Args:
+            surface (pygame.Surface): _Surface the pixel value is for._
+            color (tuple[int,int,int]): _Quantized RGB tuple._
+
+        Returns:
+            int: _Mapped pixel value._
+        """
+        mapped = self.mapped_colors.get(color)
+        if mapped is None:
+            mapped = self.mapped_colors[color] = surface.map_rgb(color)
+        return mapped
+
+
+    def draw_bodies(self, surface:pygame.Surface, bodies:list, scale:float = 1, offset:Vector2 = Vector2(0,0), quadtree = None) -> None:
+        """Draw every visible body. Camera scale and offset are used like such: _(body.position * scale) + offset | (body.radius * scale)._
+        Bodies 0-1px across are written straight into the surface's pixels, bigger ones are blitted from cached sprites in one batch. Given the solver's Quadtree, off screen cells get skipped without looking at their bodies.
+        Bodies need a sprite\_color attribute (see Celestial\_Body), the Renderer keeps their quantized color there.
+
+        Args:
+            surface (pygame.Surface): _PyGame Surface to render on._
+            bodies (list): _Bodies to draw, preferably Celestial\_Bodies._
+            scale (float, optional): _Scale of the rendered bodies, useful for "camera" implementations._ Defaults to 1.
+            offset (Vector2, optional): _Offset of the rendered bodies, useful for "camera" implementations._ Defaults to Vector2(0,0).
+            quadtree (Quadtree, optional): _Tree holding the bodies, used to cull whole cells when most of it is off screen._ Defaults to None.
+        """
+        self.bodies_drawn = 0
+        if not bodies:
+            return
+
+        if surface is not self.mapped_surface: # Mapped colors depend on the surface's pixel format
+            self.mapped_colors.clear()
+            self.mapped_surface = surface
+
+        if bodies is not self.radius_bodies or len(bodies) != self.radius_count: # Radii don't change, so only new or removed bodies can change the largest one
+            self.largest_radius = max(map(attrgetter("radius"), bodies))
+            self.radius_bodies = bodies
+            self.radius_count = len(bodies)
+
+        zooming = scale != self.sprite_scale
+        if zooming: # Zooming changes the on-screen radius of everything, drop sprites for radii that can't show up anymore
+            smallest_radius = int(min(map(attrgetter("radius"), bodies)) * scale)
+            largest_radius = int(self.largest_radius * scale)
+            for key in [key for key in self.sprites if not smallest_radius <= key[0] <= largest_radius]:
+                del self.sprites[key]
+            self.sprite_scale = scale
+
+        groups = None
+        if quadtree is not None:
+            groups = self.visible_cells(quadtree, len(bodies), scale, offset, surface.get_size(), self.largest_radius)
+        if groups is not None:
+            self.draw_groups(surface, groups, scale, offset)
+        elif zooming: # A plan made now would be thrown away next frame if the zoom keeps going
+            self.draw_groups(surface, [bodies], scale, offset)
+        else:
+            self.draw_plan(surface, bodies, scale, offset)
+
+
+    def draw_plan(self, surface:pygame.Surface, bodies:list, scale:float, offset:Vector2) -> None:
+        """Draw a whole list of bodies, this is the zoomed out path where most bodies are on screen.
+        Which bodies become pixels, which sprite each of the rest uses, and so on only changes with the zoom, so it is worked out once (the plan) and reused until the zoom, the body list or its length changes. A body's color changing won't show until then either.
+        That leaves only vector math and C calls running per body each frame.
+
+        Args:
+            surface (pygame.Surface): _PyGame Surface to render on._
+            bodies (list): _Bodies to draw._
+            scale (float): _Camera scale._
+            offset (Vector2): _Camera offset._
+        """
+        if self.plan is None or self.plan_key != (len(bodies), scale) or self.plan_bodies is not bodies or self.plan_surface is not surface:
+            self.build_plan(surface, bodies, scale)
+        pixel_bodies, pixel_colors, sprite_bodies, sprite_list, sprite_halves, large_bodies = self.plan
+        position_of = attrgetter("position")
+        width, height = surface.get_size()
+        offset_x, offset_y = offset.x, offset.y
+
+        pixels_drawn = 0
+        if pixel_bodies:
+            pixels = pygame.PixelArray(surface)
+            for position, color in zip(map(position_of, pixel_bodies), pixel_colors):
+                x = position.x*scale + offset_x
+                y = position.y*scale + offset_y
+                if 0 <= x < width and 0 <= y < height:
+                    pixels[int(x), int(y)] = color
+                    pixels_drawn += 1
+            pixels.close() # Unlocks the surface for blitting
+
+        corners = [offset - half for half in sprite_halves] # Sprites are placed by their top left corner, blitting clips anything off screen
+        self.blit_batch(surface, zip(sprite_list, [position*scale + corner for position, corner in zip(map(position_of, sprite_bodies), corners)]))
+
+        for body, radius, color in large_bodies:
+            x = body.position.x*scale + offset_x
+            y = body.position.y*scale + offset_y
+            if not (x + radius < 0 or y + radius < 0 or x - radius > width or y - radius > height): # This also keeps far away bodies from overflowing
+                gfxdraw.aacircle(surface, int(x), int(y), radius, color)
+        self.bodies_drawn = pixels_drawn + len(sprite_bodies) + len(large_bodies) # Off screen sprites are left to the blit to clip, so they count too
+
+
+    def build_plan(self, surface:pygame.Surface, bodies:list, scale:float) -> None:
+        """Sort bodies into pixels, sprites and large circles for draw\_plan().
+
+        Args:
+            surface (pygame.Surface): _Surface the plan is for, pixel colors depend on its format._
+            bodies (list): _Bodies to draw._
+            scale (float): _Camera scale._
+        """
+        pixel_bodies, pixel_colors, sprite_bodies, sprite_list, sprite_halves, large_bodies = [], [], [], [], [], []
+        for body in bodies:
+            radius = int(body.radius*scale)
+            color = self.body_color(body)
+            if radius <= 1: # A sprite would only be a pixel or two anyway
+                pixel_bodies.append(body)
+                pixel_colors.append(self.mapped_color(surface, color))
+            elif radius > self.max_sprite_radius:
+                large_bodies.append((body, radius, color))
+            else:
+                sprite_bodies.append(body)
+                sprite_list.append(self.get_sprite(radius, color))
+                sprite_halves.append(Vector2(radius, radius))
+
+        self.plan = (pixel_bodies, pixel_colors, sprite_bodies, sprite_list, sprite_halves, large_bodies)
+        self.plan_key = (len(bodies), scale)
+        self.plan_bodies = bodies
+        self.plan_surface = surface
+
+
+    def draw_groups(self, surface:pygame.Surface, groups:list[list], scale:float, offset:Vector2) -> None:
+        """Draw groups of bodies one at a time, used for the visible Quadtree cells when zoomed in and for frames where the zoom is changing.
+
+        Args:
+            surface (pygame.Surface): _PyGame Surface to render on._
+            groups (list[list]): _Lists of bodies, such as the contents of each visible cell._
+            scale (float): _Camera scale._
+            offset (Vector2): _Camera offset._
+        """
+        width, height = surface.get_size()
+        offset_x, offset_y = offset.x, offset.y
+        sprites = self.sprites
+        nearly_full = len(sprites) >= self.max_sprites * 0.9
+        pixels = None
+        batch = []
+        large = []
+        pixels_drawn = 0
+        for group in groups:
+            for body in group:
+                x = body.position.x*scale + offset_x
+                y = body.position.y*scale + offset_y
+                radius = int(body.radius*scale)
+                color = self.body_color(body)
+
+                if radius <= 1:
+                    if 0 <= x < width and 0 <= y < height:
+                        if pixels is None:
+                            pixels = pygame.PixelArray(surface)
+                        pixels[int(x), int(y)] = self.mapped_color(surface, color)
+                        pixels_drawn += 1
+                    continue
+
+                if x + radius < 0 or y + radius < 0 or x - radius > width or y - radius > height: # Off screen, this also keeps far away bodies from overflowing
+                    continue
+                if radius > self.max_sprite_radius:
+                    large.append((int(x), int(y), radius, color))
+                    continue
+
+                sprite = sprites.get((radius, color))
+                if sprite is None or nearly_full: # Recency only matters once the cache is about to start evicting
+                    sprite = self.get_sprite(radius, color)
+                batch.append((sprite, (int(x) - radius, int(y) - radius)))
+
+        if pixels is not None:
+            pixels.close() # Unlocks the surface for blitting
+        self.blit_batch(surface, batch)
+        for x, y, radius, color in large:
+            gfxdraw.aacircle(surface, x, y, radius, color)
+        self.bodies_drawn = pixels_drawn + len(batch) + len(large)
+
+
+    @staticmethod
+    def blit_batch(surface:pygame.Surface, batch) -> None:
+        """Blit a batch of (sprite, position) pairs in one call.
+
+        Args:
+            surface (pygame.Surface): _Surface to blit onto._
+            batch (Iterable): _(sprite, position) pairs._
+        """
+        if hasattr(surface, "fblits"): # PyGame-CE only, much faster
+            surface.fblits(batch)
+        else:
+            surface.blits(batch, doreturn=False)
+
+
+    def visible_cells(self, quadtree, body_count:int, scale:float, offset:Vector2, size:tuple[int,int], largest_radius:float = 0) -> list[list]:
+        """Collect the contents of every Quadtree leaf that could have a body on screen. Whole subtrees off screen are skipped, and subtrees entirely on screen are taken as they are with Quadtree.leaves().
+        The screen is padded by the largest body radius, since bodies poke out of their cell by up to that much, plus the cull margin since they keep moving after the tree is built.
+
+        Args:
+            quadtree (Quadtree): _Root of the tree._
+            body_count (int): _Number of bodies that should be in the tree._
+            scale (float): _Camera scale._
+            offset (Vector2): _Camera offset._
+            size (tuple[int,int]): _Screen size._
+            largest_radius (float, optional): _World-space radius of the biggest body._ Defaults to 0.
+
+        Returns:
+            list[list] or None: _Contents of each visible leaf, None if culling isn't worth it (most of the tree is on screen) or the tree doesn't hold body\_count bodies (new bodies since the last broadphase)._
+        """
+        # Screen edges in world space, so cells are only compared and never transformed
+        padding = self.cull_margin + largest_radius
+        left = -offset.x / scale - padding
+        top = -offset.y / scale - padding
+        right = (size[0] - offset.x) / scale + padding
+        bottom = (size[1] - offset.y) / scale + padding
+        if (right - left) * (bottom - top) >= quadtree.width * quadtree.width / 2 or quadtree.ancestor.object_count != body_count:
+            return None
+
+        groups = []
+        stack = [quadtree]
+        while stack:
+            cell = stack.pop()
+            half_width = cell.width/2
+            cell_left = cell.position.x - half_width
+            cell_right = cell.position.x + half_width
+            cell_top = cell.position.y - half_width
+            cell_bottom = cell.position.y + half_width
+            if cell_right < left or cell_left > right or cell_bottom < top or cell_top > bottom:
+                continue
+
+            if cell_left >= left and cell_right <= right and cell_top >= top and cell_bottom <= bottom:
+                groups.extend(leaf.contents for leaf in cell.leaves())
+            elif cell.is_divided:
+                for cell_row in cell.cells:
+                    stack += cell_row
+            else:
+                groups.append(cell.contents)
+        return groups
+
+
+    def draw_constraint(self, surface:pygame.Surface, solver, scale:float = 1, offset:Vector2 = Vector2(0,0)) -> None:
+        """Draw the solver's constraint, keeping a pre-rendered copy while the camera, window size and constraint stay the same.
+
+        Args:
+            surface (pygame.Surface): _Surface to draw on._
+            solver (Solver): _Solver that owns the constraint._
+            scale (float, optional): _Scale/Zoom of the environment, useful for "camera" implementations._ Defaults to 1.
+            offset (Vector2, optional): _Offset/Position of the environment, useful for "camera" implementations._ Defaults to Vector2(0,0).
+        """
+        if solver.constraint_radius is False:
+            return
+
+        key = (surface.get_size(), scale, offset.x, offset.y, tuple(solver.constraint_position), solver.constraint_radius, solver.constraint_color)
+        if key != self.constraint_key: # Panning or zooming changes the key every frame, and a full screen layer that only gets used once is slower than drawing straight away
+            self.constraint_key = key
+            self.constraint_layer = None
+            self.render_constraint(surface, solver, scale, offset)
+            return
+
+        if self.constraint_layer is None: # Same camera twice in a row, so it's likely to stick around
+            self.constraint_layer = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+            self.render_constraint(self.constraint_layer, solver, scale, offset)
+        surface.blit(self.constraint_layer, (0, 0))
+
+
+    @staticmethod
+    def render_constraint(surface:pygame.Surface, solver, scale:float, offset:Vector2) -> None:
+        """Draw the solver's constraint onto a surface, even when it's too big for gfxdraw.
+
+        Args:
+            surface (pygame.Surface): _Surface to draw on._
+            solver (Solver): _Solver that owns the constraint._
+            scale (float): _Camera scale._
+            offset (Vector2): _Camera offset._
+        """
+        try:
+            solver.draw_constraint(surface, scale, offset)
+        except OverflowError: # Zoomed in far enough that the constraint is bigger than gfxdraw can handle, so it either covers the screen or isn't on it
+            screen_center = (Vector2(surface.get_size())/2 - offset) / scale
+            if screen_center.distance_to(solver.constraint_position) < solver.constraint_radius:
+                surface.fill(solver.constraint_color)
+
+
+    def draw_quadtree(self, surface:pygame.Surface, quadtree, color:tuple[int,int,int] = (200, 200, 200), scale:float = 1, offset:Vector2 = Vector2(0,0)) -> None:
+        """Draw a Quadtree's cells, re-rendering them only when the camera, window size or tree structure changes.
+
+        Args:
+            surface (pygame.Surface): _Surface to draw on._
+            quadtree (Quadtree): _Root of the tree to draw._
+            color (tuple[int,int,int], optional): _Color of the rendered Quadtree cells._ Defaults to (200, 200, 200).
+            scale (float, optional): _Scale of the rendered cells, useful for "camera" implementations._ Defaults to 1.
+            offset (Vector2, optional): _Offset of the rendered cells, useful for "camera" implementations._ Defaults to Vector2(0,0).
+        """
+        # The solver builds a new tree every broadphase, so the tree object can't be the key. Leaves come out in a fixed depth-first order,
+        # so the root plus the width of every leaf in that order pins down exactly which cells exist.
+        if quadtree is self.quadtree_tree: # Same tree as last time, no need to walk it
+            structure = self.quadtree_structure
+        else:
+            structure = (quadtree.position.x, quadtree.position.y, quadtree.width, tuple(leaf.width for leaf in quadtree.leaves()))
+            self.quadtree_tree = quadtree
+            self.quadtree_structure = structure
+        key = (surface.get_size(), scale, offset.x, offset.y, color, structure)
+        if key != self.quadtree_key: # Moving bodies reshape the tree most frames, and a layer that only gets used once is slower than drawing straight away
+            self.quadtree_key = key
+            self.quadtree_layer = None
+            quadtree.draw_quad(surface, color, scale, offset)
+            return
+
+        if self.quadtree_layer is None: # Same tree and camera twice in a row, so it's likely to stick around
+            self.quadtree_layer = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+            quadtree.draw_quad(self.quadtree_layer, color, scale, offset)
+        surface.blit(self.quadtree_layer, (0, 0))